@@ -1,9 +1,9 @@
 import abc
-import collections
 import errno
 import functools
 import os
 import sys
+import weakref
 
 
 def coroutine(function):
@@ -30,16 +30,95 @@ else:
             pass # All other exceptions are passed to the caller
 
 
+# Positive verdicts of the subclass hooks below, keyed by (Subclass, Class).
+# ABCMeta keeps its own caches, but they are per-ABC and its negative caches
+# are thrown away whenever any class is registered with any ABC, so without
+# this every such miss rebuilt a ChainMap over the whole MRO. A verdict is
+# stored with a stamp (the MROs it was computed from) and the class that
+# defines each method; it is reused only while the stamp is unchanged and
+# every method is still in its owner's __dict__, so adding, deleting or
+# moving methods (e.g. monkeypatching) is picked up without any manual call.
+# Stamps hold the ids of the MRO's classes and owners are weakref.refs, since
+# an MRO starts with the class itself and storing it would keep the entry's
+# own key alive; the live key keeps its MRO alive, so the ids stay valid.
+# Negative verdicts are not stored: ABCMeta's own negative cache decides
+# when to ask again, just as it did before.
+_verdicts = weakref.WeakKeyDictionary()
+_checked = weakref.WeakSet()
+
+
+def _stamp(Class):
+    return tuple(map(id, Class.__mro__))
+
+
+def _owners_unchanged(owners):
+    for method, ref in owners:
+        Owner = ref()
+        if Owner is None or method not in Owner.__dict__:
+            return False
+    return True
+
+
+def _cached_verdict(Class, Subclass, stamp, find_owners):
+    _checked.add(Class)
+    verdicts = _verdicts.get(Subclass)
+    if verdicts is not None:
+        entry = verdicts.get(Class)
+        if (entry is not None and entry[0] == stamp and
+                _owners_unchanged(entry[1])):
+            return True
+    owners = find_owners()
+    if owners is None:
+        if verdicts is not None:
+            verdicts.pop(Class, None)
+        return NotImplemented
+    if verdicts is None:
+        verdicts = _verdicts[Subclass] = weakref.WeakKeyDictionary()
+    verdicts[Class] = (stamp, tuple((method, weakref.ref(Owner))
+                                    for method, Owner in owners))
+    return True
+
+
+def clear_method_cache(*classes):
+    """Forget cached verdicts for classes (and their subclasses), or for
+    every class if none are given, and clear the ABC caches of every
+    checked interface. Stale verdicts are already detected automatically;
+    this only makes isinstance() re-ask the hooks instead of trusting
+    ABCMeta's own caches."""
+    if not classes:
+        _verdicts.clear()
+    else:
+        pending = list(classes)
+        while pending:
+            Class = pending.pop()
+            _verdicts.pop(Class, None)
+            pending.extend(type.__subclasses__(Class))
+    for Class in list(_checked):
+        Class._abc_caches_clear()
+
+
+def _find_owners(Class, methods):
+    """Returns ((method, Superclass), ...) naming the class in Class's MRO
+    that defines each method, or None if any method is missing."""
+    owners = []
+    for method in methods:
+        for Superclass in Class.__mro__:
+            if method in Superclass.__dict__:
+                owners.append((method, Superclass))
+                break
+        else:
+            return None
+    return tuple(owners)
+
+
 # Thanks to Nick Coghlan for these!
 if sys.version_info[:2] >= (3, 3):
     def has_methods(*methods):
         def decorator(Base):
             def __subclasshook__(Class, Subclass):
                 if Class is Base:
-                    attributes = collections.ChainMap(*(Superclass.__dict__
-                            for Superclass in Subclass.__mro__))
-                    if all(method in attributes for method in methods):
-                        return True
+                    return _cached_verdict(Base, Subclass, _stamp(Subclass),
+                            lambda: _find_owners(Subclass, methods))
                 return NotImplemented
             Base.__subclasshook__ = classmethod(__subclasshook__)
             return Base
@@ -69,15 +148,16 @@ class Requirer(metaclass=abc.ABCMeta):
     # perform the check for subclasses
     @classmethod
     def __subclasshook__(Class, Subclass):
-        methods = set()
-        for Superclass in Subclass.__mro__:
-            if hasattr(Superclass, "required_methods"):
-                methods |= set(Superclass.required_methods)
-        attributes = collections.ChainMap(*(Superclass.__dict__
-                for Superclass in Class.__mro__))
-        if all(method in attributes for method in methods):
-            return True
-        return NotImplemented
+        def find_owners():
+            methods = set()
+            for Superclass in Subclass.__mro__:
+                if hasattr(Superclass, "required_methods"):
+                    methods |= set(Superclass.required_methods)
+            return _find_owners(Class, methods)
+        stamp = (_stamp(Subclass), _stamp(Class),
+                tuple(Superclass.__dict__.get("required_methods")
+                      for Superclass in Subclass.__mro__))
+        return _cached_verdict(Class, Subclass, stamp, find_owners)
 
 
 def report(message="", error=False):
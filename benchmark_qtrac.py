@@ -0,0 +1,72 @@
+"""
+Сравнение кешированных проверок Qtrac.has_methods с исходным хуком,
+который строил ChainMap по всему MRO при каждом промахе кеша ABC
+"""
+import abc
+import collections
+import gc
+import timeit
+import weakref
+
+import Qtrac
+
+
+METHODS = ("initialize", "draw_caption", "draw_bar", "finalize")
+
+
+def main():
+    @Qtrac.has_methods(*METHODS)
+    class Cached(metaclass=abc.ABCMeta):
+        pass
+
+    class Uncached(metaclass=abc.ABCMeta):
+
+        @classmethod
+        def __subclasshook__(Class, Subclass):
+            if Class is Uncached:
+                attributes = collections.ChainMap(*(Superclass.__dict__
+                        for Superclass in Subclass.__mro__))
+                if all(method in attributes for method in METHODS):
+                    return True
+            return NotImplemented
+
+    class Renderer:
+        def initialize(self, bars, maximum): pass
+        def draw_caption(self, caption): pass
+        def draw_bar(self, name, value): pass
+        def finalize(self): pass
+
+    # A deep hierarchy makes the MRO walk visible
+    Class = Renderer
+    for i in range(20):
+        Class = type("Renderer{}".format(i), (Class,), {})
+    renderer = Class()
+
+    number = 100000
+    for Base in (Uncached, Cached):
+        hook = timeit.timeit(lambda: Base.__subclasshook__(Class),
+                number=number)
+        # Clearing the ABC caches forces isinstance() back into the hook
+        missed = timeit.timeit(lambda: (Base._abc_caches_clear(),
+                isinstance(renderer, Base)), number=number)
+        cached = timeit.timeit(lambda: isinstance(renderer, Base),
+                number=number)
+        print("{:8} hook {:.3f}us  isinstance (ABC miss) {:.3f}us  "
+              "isinstance (ABC hit) {:.3f}us".format(Base.__name__,
+              hook / number * 1e6, missed / number * 1e6,
+              cached / number * 1e6))
+
+    # Cached verdicts must not keep throwaway classes alive
+    refs = []
+    for i in range(100):
+        Throwaway = type("Throwaway{}".format(i), (Renderer,), {})
+        isinstance(Throwaway(), Cached)
+        refs.append(weakref.ref(Throwaway))
+    del Throwaway
+    gc.collect()
+    print("throwaway classes alive after gc: {}/{}".format(
+          sum(ref() is not None for ref in refs), len(refs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
+import functools
+import gzip
+import io
 import os
 import tempfile
+# numpy - необязательная зависимость (pip install numpy): она нужна
+# только NumpyDiagramFactory, остальные фабрики работают без нее
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def main():
 
     text_filename = os.path.join(tempfile.gettempdir(), "diagram.txt")
     svg_filename = os.path.join(tempfile.gettempdir(), "diagram.svg")
+    svgz_filename = os.path.join(tempfile.gettempdir(), "diagram.svgz")
 
     txt_diagram = create_diagram(DiagramFactory())
     txt_diagram.save(text_filename)
@@ -15,6 +25,10 @@ def main():
     svg_diagram.save(svg_filename)
     print("wrote", svg_filename)
 
+    with create_diagram(StreamingSvgDiagramFactory(svgz_filename)):
+        pass
+    print("wrote", svgz_filename)
+
 
 def create_diagram(factory):
     diagram = factory.make_diagram(30, 7)
@@ -38,6 +52,24 @@ class DiagramFactory:
         return Text(x, y, text, fontsize)
 
 
+class NumpyDiagramFactory(DiagramFactory):
+    """
+    Текстовая диаграмма на двумерном массиве кодов символов (uint32):
+    добавление прямоугольника или текста - одно присваивание среза,
+    сохранение - одно кодирование всего массива. Требует numpy
+    """
+
+    def make_diagram(self, width, height):
+        return NumpyDiagram(width, height)
+
+    def make_rectangle(self, x, y, width, height, fill="white",
+            stroke="black"):
+        return NumpyRectangle(x, y, width, height, fill, stroke)
+
+    def make_text(self, x, y, text, fontsize=12):
+        return NumpyText(x, y, text, fontsize)
+
+
 class SvgDiagramFactory(DiagramFactory):
     def make_diagram(self, width, height):
         return SvgDiagram(width, height)
@@ -49,6 +81,22 @@ class SvgDiagramFactory(DiagramFactory):
         return SvgText(x, y, text, fontsize)
 
 
+class StreamingSvgDiagramFactory(SvgDiagramFactory):
+    """
+    SVG-диаграмма, которая не хранит документ в памяти: заголовок пишется
+    при создании, каждый add() - сразу в файл (.svgz - со сжатием gzip)
+    или сокет, а SVG_END - при закрытии или выходе из блока with
+    """
+
+    def __init__(self, filenameOrFile, buffer_size=None):
+        self.filenameOrFile = filenameOrFile
+        self.buffer_size = buffer_size
+
+    def make_diagram(self, width, height):
+        return StreamingSvgDiagram(self.filenameOrFile, width, height,
+                                   self.buffer_size)
+
+
 BLANK = " "
 CORNER = "+"
 HORIZONTAL = "-"
@@ -68,12 +116,18 @@ class Diagram:
     def __init__(self, width, height):
         self.width = width
         self.height = height
-        self.diagram = _create_rectangle(self.width, self.height, BLANK)
+        # Строки холста - общие неизменяемые шаблоны; строка копируется
+        # в список только при первой записи в нее (copy-on-write)
+        self.diagram = list(_create_rectangle(self.width, self.height, BLANK))
 
     def add(self, component):
-        for y, row in enumerate(component.rows):
-            for x, char in enumerate(row):
-                self.diagram[y + component.y][x + component.x] = char
+        for y, row in enumerate(component.rows, component.y):
+            if component.x + len(row) > self.width:
+                raise IndexError("component does not fit the diagram")
+            target = self.diagram[y]
+            if isinstance(target, str):
+                target = self.diagram[y] = list(target)
+            target[component.x:component.x + len(row)] = row
 
     def save(self, filename):
         file = None if isinstance(filename, str) else filename
@@ -81,13 +135,23 @@ class Diagram:
             if file is None:
                 file = open(filename, "w", encoding="utf-8")
                 for row in self.diagram:
-                    print("".join(row), file=file)
+                    print(row if isinstance(row, str) else "".join(row),
+                          file=file)
         finally:
             if isinstance(filename, str) and file is not None:
                 file.close()
 
 
+@functools.lru_cache(maxsize=1024)
 def _create_rectangle(width, height, fill):
+    """
+    Возвращает общий для всех вызовов с теми же аргументами шаблон:
+    кортеж строк, который нельзя изменять на месте
+    """
+    if width >= 2 and height >= 2:
+        edge = CORNER + HORIZONTAL * (width - 2) + CORNER
+        middle = VERTICAL + fill * (width - 2) + VERTICAL
+        return (edge,) + (middle,) * (height - 2) + (edge,)
     rows = [[fill for _ in range(width)] for _ in range(height)]
     for x in range(1, width - 1):
         rows[0][x] = HORIZONTAL
@@ -98,7 +162,7 @@ def _create_rectangle(width, height, fill):
     for y, x in ((0, 0), (0, width - 1), (height - 1, 0),
             (height - 1, width -1)):
         rows[y][x] = CORNER
-    return rows
+    return tuple("".join(row) for row in rows)
 
 
 class Rectangle:
@@ -110,6 +174,74 @@ class Rectangle:
                 BLANK if fill == "white" else "%")
 
 
+class NumpyText:
+
+    def __init__(self, x, y, text, fontsize):
+        self.x = x
+        self.y = y
+        self.rows = _text_array(text)
+
+
+class NumpyDiagram:
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.diagram = _rectangle_array(self.width, self.height,
+                                        BLANK).copy()
+
+    def add(self, component):
+        rows = component.rows
+        if not isinstance(rows, numpy.ndarray):
+            rows = numpy.array([_text_array("".join(row))[0] for row in rows],
+                    dtype=numpy.uint32)
+        height, width = rows.shape
+        self.diagram[component.y:component.y + height,
+                     component.x:component.x + width] = rows
+
+    def save(self, filename):
+        lines = numpy.empty((self.height, self.width + 1), dtype=numpy.uint32)
+        lines[:, :-1] = self.diagram
+        lines[:, -1] = ord("\n")
+        text = lines.astype("<u4").tobytes().decode("utf-32-le")
+        file = None if isinstance(filename, str) else filename
+        try:
+            if file is None:
+                file = open(filename, "w", encoding="utf-8")
+            file.write(text)
+        finally:
+            if isinstance(filename, str) and file is not None:
+                file.close()
+
+
+def _text_array(text):
+    if numpy is None:
+        raise ImportError("numpy is required for NumpyDiagramFactory")
+    return numpy.frombuffer(text.encode("utf-32-le"),
+            dtype="<u4").astype(numpy.uint32).reshape(1, len(text))
+
+
+@functools.lru_cache(maxsize=1024)
+def _rectangle_array(width, height, fill):
+    if numpy is None:
+        raise ImportError("numpy is required for NumpyDiagramFactory")
+    rows = numpy.full((height, width), ord(fill), dtype=numpy.uint32)
+    rows[(0, -1), 1:-1] = ord(HORIZONTAL)
+    rows[1:-1, (0, -1)] = ord(VERTICAL)
+    rows[(0, 0, -1, -1), (0, -1, 0, -1)] = ord(CORNER)
+    rows.flags.writeable = False
+    return rows
+
+
+class NumpyRectangle:
+
+    def __init__(self, x, y, width, height, fill, stroke):
+        self.x = x
+        self.y = y
+        self.rows = _rectangle_array(width, height,
+                BLANK if fill == "white" else "%")
+
+
 SVG_START = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
 <!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 20010904//EN"
     "http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/svg10.dtd">
@@ -127,6 +259,8 @@ font-family="sans-serif" font-size="{fontsize}">{text}</text>"""
 
 SVG_SCALE = 20
 
+STREAM_BUFFER_SIZE = 1 << 16
+
 
 class SvgDiagram:
 
@@ -152,6 +286,71 @@ class SvgDiagram:
                 file.close()
 
 
+class StreamingSvgDiagram:
+
+    def __init__(self, filenameOrFile, width, height,
+            buffer_size=None):
+        if buffer_size is None:
+            buffer_size = STREAM_BUFFER_SIZE
+        self.file, self._finish = _open_sink(filenameOrFile, buffer_size)
+        self.closed = False
+        try:
+            pxwidth = width * SVG_SCALE
+            pxheight = height * SVG_SCALE
+            self.file.write(SVG_START.format(**locals()))
+            outline = SvgRectangle(0, 0, width, height, "lightgreen", "black")
+            self.add(outline)
+        except BaseException:
+            self._finish()
+            raise
+
+    def add(self, component):
+        if self.closed:
+            raise ValueError("diagram is already closed")
+        self.file.write("\n" + component.svg)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.file.write("\n" + SVG_END)
+            finally:
+                self._finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open_sink(filenameOrFile, buffer_size):
+    """
+    Возвращает текстовый файл для записи и функцию, которая завершает
+    запись: закрывает то, что открыто здесь, и сбрасывает буфер чужого
+    файла, не закрывая его
+    """
+    if isinstance(filenameOrFile, str):
+        if filenameOrFile.lower().endswith(".svgz"):
+            file = io.TextIOWrapper(io.BufferedWriter(gzip.open(
+                    filenameOrFile, "wb"), buffer_size), encoding="utf-8")
+        else:
+            file = open(filenameOrFile, "w", encoding="utf-8",
+                        buffering=buffer_size)
+        return file, file.close
+    if hasattr(filenameOrFile, "sendall"): # сокет
+        file = filenameOrFile.makefile("w", encoding="utf-8",
+                                       buffering=buffer_size)
+        return file, file.close
+    if isinstance(filenameOrFile, io.TextIOBase):
+        return filenameOrFile, filenameOrFile.flush
+    file = io.TextIOWrapper(filenameOrFile, encoding="utf-8")
+    def finish():
+        file.flush()
+        file.detach()
+    return file, finish
+
+
 class SvgRectangle:
 
     def __init__(self, x, y, width, height, fill, stroke):
@@ -12,10 +12,21 @@
 должно быть отделено от алгоритмов композиции
 """
 import abc
+import collections
+import concurrent.futures
+import functools
+import inspect
+import itertools
+import json
 import os
 import re
 import tempfile
-from html import escape
+import time
+from html import escape as html_escape
+
+# Общий кеш экранирования: в пакетной генерации одни и те же подписи
+# и значения повторяются в тысячах форм
+escape = functools.lru_cache(maxsize=4096)(html_escape)
 
 
 def main():
@@ -41,10 +52,143 @@ def create_login_form(builder):
     return builder.form()
 
 
+def build_form(builder, spec):
+    """
+    spec - описание формы, например из JSON:
+    {"name": "login", "title": "Login", "widgets": [
+        {"type": "label", "text": "Username", "row": 0, "column": 0,
+         "target": "username"},
+        {"type": "entry", "variable": "username", "row": 0, "column": 1},
+        {"type": "button", "text": "Login", "row": 1, "column": 0}]}
+    Построитель очищается вызовом reset(), поэтому его можно использовать
+    для многих форм подряд
+    """
+    builder.reset()
+    if "title" in spec:
+        builder.add_title(spec["title"])
+    for widget in spec["widgets"]:
+        widget = dict(widget)
+        getattr(builder, "add_" + widget.pop("type"))(**widget)
+    return builder.form()
+
+
+def build_forms(specs, builder_class, file=None, directory=None,
+        workers=None, chunksize=64):
+    """
+    Строит формы по всем описаниям specs и записывает их либо подряд в file,
+    либо каждую в свой файл name + builder_class.EXTENSION в directory.
+    При workers > 1 формы строятся в пуле процессов, у каждого процесса
+    свой построитель и свои кеши, а в работе не больше 2 * workers пачек
+    по chunksize описаний, поэтому specs может быть длинным генератором.
+    Возвращает число построенных форм.
+    Имена файлов не должны повторяться или содержать разделители пути,
+    иначе возбуждается ValueError
+    """
+    if (file is None) == (directory is None):
+        raise ValueError("exactly one of file or directory must be given")
+    jobs = ((builder_class, spec) for spec in specs)
+    executor = None
+    if workers is not None and workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+        forms = _map_window(executor, _build_form, jobs, chunksize,
+                            2 * workers)
+    else:
+        forms = map(_build_form, jobs)
+    count = 0
+    names = set()
+    try:
+        for name, text in forms:
+            if file is not None:
+                file.write(text)
+                file.write("\n")
+            else:
+                _check_file_name(name, names)
+                names.add(name)
+                with open(os.path.join(directory, name +
+                        builder_class.EXTENSION), "w",
+                        encoding="utf-8") as output:
+                    output.write(text)
+            count += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return count
+
+
+def _map_window(executor, function, jobs, chunksize, window):
+    """
+    Как executor.map(function, jobs, chunksize=chunksize), но описания
+    читаются по мере обработки: в работе не больше window пачек по
+    chunksize, а результаты выдаются в исходном порядке
+    """
+    pending = collections.deque()
+    jobs = iter(jobs)
+    while True:
+        while len(pending) < window:
+            chunk = list(itertools.islice(jobs, chunksize))
+            if not chunk:
+                break
+            pending.append(executor.submit(_build_chunk, function, chunk))
+        if not pending:
+            return
+        yield from pending.popleft().result()
+
+
+def _build_chunk(function, chunk):
+    return [function(job) for job in chunk]
+
+
+def load_form_specs(filename):
+    """Описания форм из файла JSON (список) или JSONL (по одному в строке)"""
+    with open(filename, encoding="utf-8") as file:
+        if filename.endswith(".jsonl"):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(file)
+
+
+def _check_file_name(name, names):
+    if (name in ("", os.curdir, os.pardir) or "/" in name or os.sep in name
+            or (os.altsep is not None and os.altsep in name)):
+        raise ValueError("form name {!r} is not a plain file name".format(
+                name))
+    if name in names:
+        raise ValueError("duplicate form name {!r}".format(name))
+
+
+_builders = {}
+
+
+def _build_form(job):
+    builder_class, spec = job
+    builder = _builders.get(builder_class)
+    if builder is None:
+        builder = _builders[builder_class] = builder_class()
+    name = spec.get("name") or _canonicalize(spec.get("title", "form"))
+    return name, build_form(builder, spec)
+
+
 class AbstractFormBuilder(metaclass=abc.ABCMeta):
     # из-за наследования от abc.ABCMeta данный класс нельзя инстанцировать
     # то есть можно использовать только в качестве абстрактного базового класса
 
+    # Методы add_*() только запоминают вызовы. Форма по последовательности
+    # вызовов компилируется один раз в шаблон, а значения полей (value=...)
+    # подставляются в его слоты при каждом вызове form(). _compile()
+    # возвращает список частей: строки и номера значений (int) на месте слотов
+    CACHE_SIZE = 256
+    _templates = {}
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.title = self.DEFAULT_TITLE
+        self.calls = []
+        self.values = []
+
     @abc.abstractmethod
     def add_title(self, title):
         self.title = title
@@ -65,6 +209,112 @@ class AbstractFormBuilder(metaclass=abc.ABCMeta):
     def add_button(self, text, row, column, **kwargs):
         pass
 
+    @abc.abstractmethod
+    def _compile(self):
+        pass
+
+    def _record(self, *call, value=None):
+        if value is not None:
+            self.values.append(value)
+            call += (len(self.values) - 1,)
+        else:
+            call += (None,)
+        self.calls.append(call)
+
+    def _cached_form(self):
+        key = (type(self), self.title, tuple(self.calls))
+        templates = AbstractFormBuilder._templates
+        template = templates.get(key)
+        if template is None:
+            fragments = [[]]
+            order = []
+            for part in self._compile():
+                if isinstance(part, int):
+                    order.append(part)
+                    fragments.append([])
+                else:
+                    fragments[-1].append(part)
+            template = (["".join(fragment) for fragment in fragments], order)
+            if len(templates) >= AbstractFormBuilder.CACHE_SIZE:
+                del templates[next(iter(templates))]
+            templates[key] = template
+        fragments, order = template
+        text = [fragments[0]]
+        for index, fragment in zip(order, fragments[1:]):
+            text.append(self.values[index])
+            text.append(fragment)
+        return "".join(text)
+
+
+INSTRUMENTED_METHODS = ("add_title", "add_label", "add_entry", "add_button",
+        "form")
+_originals = {}
+
+
+def set_instrumentation(callback):
+    """
+    Включает замеры для всех конкретных подклассов AbstractFormBuilder:
+    после каждого вызова метода из INSTRUMENTED_METHODS вызывается
+    callback(builder, method, seconds, size), где size - длина
+    возвращенной строки (0 для методов add_*()).
+
+    Методы классов заменяются обертками только на время замеров, а
+    set_instrumentation(None) возвращает исходные методы, поэтому в
+    выключенном состоянии замеры ничего не стоят. Классы, объявленные
+    после включения, не замеряются
+    """
+    for (Class, name), function in _originals.items():
+        setattr(Class, name, function)
+    _originals.clear()
+    if callback is None:
+        return
+    pending = [AbstractFormBuilder]
+    while pending:
+        Class = pending.pop()
+        pending.extend(Class.__subclasses__())
+        if inspect.isabstract(Class):
+            continue
+        for name in INSTRUMENTED_METHODS:
+            function = Class.__dict__.get(name)
+            if function is not None:
+                _originals[Class, name] = function
+                setattr(Class, name, _timed(function, name, callback))
+
+
+def _timed(function, name, callback):
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(self, *args, **kwargs)
+        callback(self, name, time.perf_counter() - start,
+                 len(result) if isinstance(result, str) else 0)
+        return result
+    return wrapper
+
+
+class BuilderStats:
+    """
+    Готовый callback для set_instrumentation(): число вызовов, суммарное
+    время и суммарный размер результата по каждому (классу, методу)
+    """
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+        self.sizes = collections.Counter()
+
+    def __call__(self, builder, method, seconds, size):
+        key = (type(builder).__name__, method)
+        self.calls[key] += 1
+        self.seconds[key] += seconds
+        self.sizes[key] += size
+
+    def report(self):
+        return "\n".join("{}.{}: {} calls, {:.6f}s, {} chars".format(
+                Class, method, self.calls[Class, method],
+                self.seconds[Class, method], self.sizes[Class, method])
+                for Class, method in sorted(self.calls))
+
 
 # first, second, *rest = sequence
 # first == sequence[0]
@@ -76,46 +326,61 @@ class AbstractFormBuilder(metaclass=abc.ABCMeta):
 # print_setup(*args, **kwargs)
 
 class HtmlFormBuilder(AbstractFormBuilder):
-    def __init__(self):
-        self.title = "HtmlFormBuilder"
-        self.items = {}
+    DEFAULT_TITLE = "HtmlFormBuilder"
+    EXTENSION = ".html"
 
     def add_title(self, title):
         super().add_title(escape(title))
 
     def add_label(self, text, row, column, **kwargs):
-        self.items[(row, column)] = '<td><label for="{}">{}:'\
-                                '</label></td>'.format(kwargs["target"], escape(text))
+        self._record("label", text, row, column, kwargs["target"])
 
     def add_entry(self, variable, row, column, **kwargs):
-        print('add_entry', kwargs)
-        print(kwargs.get("kind", "text"))
-        html = """<td><input name="{}" type="{}" /></td>""".format(
-                variable, kwargs.get("kind", "text"))
-        self.items[(row, column)] = html
+        value = kwargs.get("value")
+        self._record("entry", variable, row, column, kwargs.get("kind", "text"),
+                value=None if value is None else escape(value))
 
     def add_button(self, text, row, column, **kwargs):
-        html = """<td><input type="submit" value="{}" /></td>""".format(
-                escape(text))
-        self.items[(row, column)] = html
+        self._record("button", text, row, column, None)
 
     def form(self):
-        html = ["<!doctype html>\n<html><head><title>{}</title></head>"
-                "<body>".format(self.title), '<form><table border="0">']
+        return self._cached_form()
+
+    def _compile(self):
+        items = {}
+        for kind, text, row, column, extra, value in self.calls:
+            if kind == "label":
+                html = ('<td><label for="{}">{}:</label></td>'.format(extra,
+                        escape(text)),)
+            elif kind == "entry":
+                if value is None:
+                    html = ("""<td><input name="{}" type="{}" /></td>""".format(
+                            text, extra),)
+                else:
+                    html = ("""<td><input name="{}" type="{}" value=""".format(
+                            text, extra) + '"', value, '" /></td>')
+            else:
+                html = ("""<td><input type="submit" value="{}" /></td>""".format(
+                        escape(text)),)
+            items[(row, column)] = html
+        html = [("<!doctype html>\n<html><head><title>{}</title></head>"
+                "<body>".format(self.title),), ('<form><table border="0">',)]
         thisRow = None
-        for key, value in sorted(self.items.items()):
+        for key, value in sorted(items.items()):
             row, column = key
             if thisRow is None:
-                html.append("  <tr>")
+                html.append(("  <tr>",))
             elif thisRow != row:
-                html.append("  </tr>\n  <tr>")
+                html.append(("  </tr>\n  <tr>",))
             thisRow = row
-            html.append("    " + value)
-        html.append("  </tr>\n</table></form></body></html>")
-        return "\n".join(html)
+            html.append(("    ",) + value)
+        html.append(("  </tr>\n</table></form></body></html>",))
+        return _join_parts("\n", html)
 
 
 class TkFormBuilder(AbstractFormBuilder):
+    DEFAULT_TITLE = "TkFormBuilder"
+    EXTENSION = ".py"
 
     TEMPLATE = """#!/usr/bin/env python3
     import tkinter as tk
@@ -140,45 +405,73 @@ class TkFormBuilder(AbstractFormBuilder):
         application.mainloop()
     """
 
-    def __init__(self):
-        self.title = "TkFormBuilder"
-        self.statements = []
-
     def form(self):
-        return TkFormBuilder.TEMPLATE.format(title=self.title,
-                name=self._canonicalize(self.title, False),
-                statements="\n        ".join(self.statements))
+        return self._cached_form()
+
+    def _compile(self):
+        statements = []
+        for kind, text, row, column, extra, value in self.calls:
+            name = self._canonicalize(text)
+            if kind == "label":
+                create = """self.{}Label = ttk.Label(self, text="{}:")""".format(name, text)
+                layout = """self.{}Label.grid(row={}, column={}, sticky=tk.W, \
+            padx="0.75m", pady="0.75m")""".format(name, row, column)
+            elif kind == "entry":
+                extra = "" if extra != "password" else ', show="*"'
+                create = "self.{}Entry = ttk.Entry(self{})".format(name, extra)
+                layout = """self.{}Entry.grid(row={}, column={}, sticky=(\
+                tk.W, tk.E), padx="0.75m", pady="0.75m")""".format(name, row, column)
+                if value is not None:
+                    layout = (layout, "\n        self.{}Entry.insert(0, "
+                              .format(name), value, ")")
+            else:
+                create = ("""self.{}Button = ttk.Button(self, text="{}")""".format(name, text))
+                layout = """self.{}Button.grid(row={}, column={}, padx="0.75m", \
+                pady="0.75m")""".format(name, row, column)
+            statements.extend(((create,), layout if isinstance(layout, tuple)
+                               else (layout,)))
+        # Текст шаблона делится по {statements} до подстановки, поэтому
+        # фигурные скобки в заголовке не мешают
+        head, tail = TkFormBuilder.TEMPLATE.split("{statements}")
+        name = self._canonicalize(self.title, False)
+        return ([head.format(title=self.title, name=name)] +
+                _join_parts("\n        ", statements) +
+                [tail.format(name=name)])
 
     def add_label(self, text, row, column, **kwargs):
-        name = self._canonicalize(text)
-        create = """self.{}Label = ttk.Label(self, text="{}:")""".format(name, text)
-        layout = """self.{}Label.grid(row={}, column={}, sticky=tk.W, \
-            padx="0.75m", pady="0.75m")""".format(name, row, column)
-        self.statements.extend((create, layout))
+        self._record("label", text, row, column, None)
 
     def add_entry(self, variable, row, column, **kwargs):
-        name = self._canonicalize(variable)
-        extra = "" if kwargs.get("kind") != "password" else ', show="*"'
-        create = "self.{}Entry = ttk.Entry(self{})".format(name, extra)
-        layout = """self.{}Entry.grid(row={}, column={}, sticky=(\
-                tk.W, tk.E), padx="0.75m", pady="0.75m")""".format(name, row, column)
-        self.statements.extend((create, layout))
+        value = kwargs.get("value")
+        self._record("entry", variable, row, column, kwargs.get("kind"),
+                value=None if value is None else json.dumps(value))
 
     def add_button(self, text, row, column, **kwargs):
-        name = self._canonicalize(text)
-        create = ("""self.{}Button = ttk.Button(self, text="{}")""".format(name, text))
-        layout = """self.{}Button.grid(row={}, column={}, padx="0.75m", \
-                pady="0.75m")""".format(name, row, column)
-        self.statements.extend((create, layout))
+        self._record("button", text, row, column, None)
 
     def add_title(self, title):
         super().add_title(title)
 
     def _canonicalize(self, text, startLower=True):
-        text = re.sub(r"\W+", "", text)
-        if text[0].isdigit():
-            return "_" + text
-        return text if not startLower else text[0].lower() + text[1:]
+        return _canonicalize(text, startLower)
+
+
+def _join_parts(separator, lines):
+    # Аналог separator.join() для строк, составленных из частей
+    parts = []
+    for line in lines:
+        if parts:
+            parts.append(separator)
+        parts.extend(line)
+    return parts
+
+
+@functools.lru_cache(maxsize=1024)
+def _canonicalize(text, startLower=True):
+    text = re.sub(r"\W+", "", text)
+    if text[0].isdigit():
+        return "_" + text
+    return text if not startLower else text[0].lower() + text[1:]
 
 
 if __name__ == "__main__":
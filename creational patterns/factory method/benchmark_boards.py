@@ -0,0 +1,98 @@
+"""
+Скорость построения досок и память на одну доску для factory_method_1 и
+factory_method_2. Для сравнения строятся и доски, в которых каждая фигура
+создается заново, как до введения разделяемых фигур, а также пакеты досок
+board_batch.build_boards() в одном и в нескольких процессах и время
+импорта каждого модуля в новом интерпретаторе
+"""
+import gc
+import os
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+import board_batch
+import factory_method_1
+import factory_method_2
+
+
+def main():
+    for module in (factory_method_1, factory_method_2):
+        print("{} (import: self {}us, cumulative {}us)".format(
+              module.__name__, *import_time(module.__name__)))
+        for name, make_board in board_factories(module):
+            per_second, size = measure(make_board)
+            print("    {:28} {:10.0f} boards/s {:8.0f} bytes/board".format(
+                  name, per_second, size))
+        for Board in (module.ChessBoard, module.CheckersBoard):
+            for processes in (None, os.cpu_count()):
+                per_second, size = measure_batch(Board, processes)
+                print("    {:28} {:10.0f} boards/s {:8.0f} bytes/board".format(
+                      "{} batch x{}".format(Board.__name__, processes or 1),
+                      per_second, size))
+
+
+def board_factories(module):
+    factories = []
+    for Board in (module.ChessBoard, module.CheckersBoard):
+        name = Board.__name__
+        factories.append((name, Board))
+        factories.append((name + " (bitboard)",
+                          lambda Board=Board: Board(bitboard=True)))
+        factories.append((name + " (new pieces)",
+                          lambda Board=Board: unshared(Board())))
+    return factories
+
+
+def unshared(board):
+    # Заменяет разделяемые фигуры отдельными экземплярами их классов
+    for row in board.board:
+        for column, piece in enumerate(row):
+            if piece is not None:
+                row[column] = type(piece)()
+    return board
+
+
+def measure(make_board, number=2000):
+    seconds = min(timeit.repeat(make_board, number=number, repeat=3))
+    gc.collect()
+    tracemalloc.start()
+    boards = [make_board() for _ in range(number)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del boards
+    return number / seconds, size / number
+
+
+def measure_batch(Board, processes, number=20000):
+    start = time.perf_counter()
+    with board_batch.build_boards(Board, count=number,
+                                  processes=processes) as batch:
+        seconds = time.perf_counter() - start
+        return number / seconds, batch.nbytes / number
+
+
+def import_time(name, repeat=5):
+    """
+    Наименьшее время импорта модуля по python -X importtime: собственное
+    и вместе с импортируемыми им модулями
+    """
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                 "import " + name], capture_output=True,
+                                text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == name:
+                times = (int(fields[0].split(":")[1]), int(fields[1]))
+                if best is None or times < best:
+                    best = times
+    return best
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Пакетное построение досок из factory_method_1 и factory_method_2.
+
+Доски строятся в пуле процессов и сразу кодируются в общий блок памяти
+(multiprocessing.shared_memory): по одному байту на клетку, 0 - пустая
+клетка, иначе номер фигуры в GLYPHS плюс 1. Процессы ничего не передают
+обратно через pickle, а BoardBatch читает доски прямо из общего блока.
+
+Доски можно описывать строками в духе FEN: ряды через "/", цифры - число
+пустых клеток подряд, KQRBNP - белые шахматные фигуры, kqrbnp - черные,
+D и d - белая и черная шашки
+"""
+import collections
+import concurrent.futures
+import itertools
+import re
+import sys
+from multiprocessing import shared_memory
+
+DRAUGHT, PAWN, ROOK, KNIGHT, BISHOP, KING, QUEEN = ("DRAUGHT", "PAWN",
+        "ROOK", "KNIGHT", "BISHOP", "KING", "QUEEN")
+BLACK, WHITE = ("BLACK", "WHITE")
+
+GLYPHS = tuple(chr(code) for code in itertools.chain((0x26C0, 0x26C2),
+               range(0x2654, 0x2660)))
+LETTERS = "DdKQRBNPkqrbnp"
+_KIND_FOR_LETTER = {"d": DRAUGHT, "k": KING, "q": QUEEN, "r": ROOK,
+                    "b": BISHOP, "n": KNIGHT, "p": PAWN}
+_CODE_FOR_GLYPH = {glyph: code for code, glyph in enumerate(GLYPHS, 1)}
+_LETTER_FOR_GLYPH = dict(zip(GLYPHS, LETTERS))
+_ROW = re.compile(r"\d+|\D")
+
+
+def build_boards(Board, count=None, descriptions=None, processes=None,
+        chunksize=256):
+    """
+    Строит count начальных досок класса Board или по одной доске на каждое
+    описание из descriptions. При processes > 1 работа делится между
+    процессами; результат - BoardBatch поверх общего блока памяти.
+
+    descriptions может быть потоком, например генератором, читающим файл:
+    он читается пачками по chunksize, и в обработке одновременно не больше
+    двух пачек на процесс. Размер общего блока нужен заранее, поэтому для
+    потока без len() передается count (берутся первые count описаний),
+    иначе описания сначала собираются в список. Размер доски определяется
+    по первому описанию, а каждая доска проверяется при заполнении своей
+    пачки: доска другого размера или поток короче count - ValueError
+    """
+    if descriptions is not None:
+        if count is None:
+            if not hasattr(descriptions, "__len__"):
+                descriptions = list(descriptions)
+            count = len(descriptions)
+        descriptions = iter(descriptions)
+        first = next(descriptions, None) if count else None
+        if first is None:
+            rows, columns = 0, 0
+        else:
+            rows, columns = _size(first)
+            descriptions = itertools.chain((first,), descriptions)
+    elif count is None:
+        raise ValueError("either count or descriptions must be given")
+    else:
+        sample = Board()
+        rows, columns = len(sample.board), len(sample.board[0])
+    memory = shared_memory.SharedMemory(create=True, size=max(1,
+                                        count * rows * columns))
+    try:
+        jobs = _jobs(memory.name, Board, count, descriptions, rows, columns,
+                     chunksize)
+        if processes is not None and processes > 1:
+            with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+                pending = collections.deque()
+                for job in jobs:
+                    pending.append(executor.submit(_fill, job))
+                    if len(pending) >= 2 * processes:
+                        pending.popleft().result()
+                while pending:
+                    pending.popleft().result()
+        else:
+            for job in jobs:
+                _fill(job, memory)
+    except BaseException:
+        memory.close()
+        memory.unlink()
+        raise
+    return BoardBatch(memory, Board, count, rows, columns)
+
+
+def _jobs(name, Board, count, descriptions, rows, columns, chunksize):
+    for start in range(0, count, chunksize):
+        length = min(chunksize, count - start)
+        chunk = None
+        if descriptions is not None:
+            chunk = list(itertools.islice(descriptions, length))
+            if len(chunk) < length:
+                raise ValueError("descriptions ended after {} boards, "
+                                 "expected {}".format(start + len(chunk),
+                                                      count))
+        yield name, Board, start, length, chunk, rows, columns
+
+
+class BoardBatch:
+
+    def __init__(self, memory, Board, count, rows, columns):
+        self.memory = memory
+        self.Board = Board
+        self.count = count
+        self.rows = rows
+        self.columns = columns
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.count * self.rows * self.columns
+
+    def codes(self, index):
+        """Коды клеток доски index - срез общей памяти без копирования"""
+        if not 0 <= index < self.count:
+            raise IndexError("board index out of range")
+        size = self.rows * self.columns
+        return self.memory.buf[index * size:(index + 1) * size]
+
+    def __getitem__(self, index):
+        return board_from_codes(self.Board, self.codes(index), self.rows,
+                                self.columns)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def board_from_description(Board, description, bitboard=False):
+    board = _empty_board(Board, *_size(description))
+    for row, text in enumerate(description.split("/")):
+        column = 0
+        for token in _ROW.findall(text):
+            if token.isdigit():
+                column += int(token)
+                continue
+            kind = _KIND_FOR_LETTER.get(token.lower())
+            if kind is None:
+                raise ValueError("unknown piece {!r} in {!r}".format(token,
+                                 description))
+            board.place(row, column, _create_piece(board, kind,
+                        WHITE if token.isupper() else BLACK))
+            column += 1
+    return _finish(board, bitboard)
+
+
+def describe(board):
+    rows = []
+    for row in board.board:
+        text = []
+        empty = 0
+        for piece in row:
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                text.append(str(empty))
+                empty = 0
+            text.append(_LETTER_FOR_GLYPH[piece])
+        if empty:
+            text.append(str(empty))
+        rows.append("".join(text))
+    return "/".join(rows)
+
+
+def board_from_codes(Board, codes, rows, columns, bitboard=False):
+    board = _empty_board(Board, rows, columns)
+    pieces = {}
+    for square, code in enumerate(codes):
+        if code:
+            glyph = GLYPHS[code - 1]
+            piece = pieces.get(glyph)
+            if piece is None:
+                letter = _LETTER_FOR_GLYPH[glyph]
+                piece = pieces[glyph] = _create_piece(board,
+                        _KIND_FOR_LETTER[letter.lower()],
+                        WHITE if letter.isupper() else BLACK)
+            board.place(square // columns, square % columns, piece)
+    return _finish(board, bitboard)
+
+
+def _fill(job, memory=None):
+    name, Board, start, count, descriptions, rows, columns = job
+    size = rows * columns
+    attached = memory is None
+    if attached:
+        memory = shared_memory.SharedMemory(name=name)
+    try:
+        buffer = memory.buf
+        for offset in range(count):
+            if descriptions is None:
+                board = Board()
+            else:
+                board = board_from_description(Board, descriptions[offset])
+                if (len(board.board), len(board.board[0])) != (rows, columns):
+                    raise ValueError("board {!r} is not {}x{} like the first "
+                            "board".format(descriptions[offset], rows,
+                                           columns))
+            position = (start + offset) * size
+            for row in board.board:
+                for piece in row:
+                    buffer[position] = (0 if piece is None else
+                                        _CODE_FOR_GLYPH[piece])
+                    position += 1
+        del buffer
+    finally:
+        if attached:
+            memory.close()
+
+
+def _size(description):
+    rows = description.split("/")
+    widths = {sum(int(token) if token.isdigit() else 1
+                  for token in _ROW.findall(row)) for row in rows}
+    if len(widths) != 1:
+        raise ValueError("rows of {!r} differ in length".format(description))
+    return len(rows), widths.pop()
+
+
+def _empty_board(Board, rows, columns):
+    board = object.__new__(Board)
+    board.board = [[None] * columns for _ in range(rows)]
+    board.zobrist = 0
+    return board
+
+
+def _create_piece(board, kind, color):
+    # В factory_method_1 фабричный метод принадлежит доске,
+    # в factory_method_2 это функция модуля
+    create_piece = getattr(board, "create_piece", None)
+    if create_piece is None:
+        create_piece = sys.modules[type(board).__module__].create_piece
+    return create_piece(kind, color)
+
+
+def _finish(board, bitboard):
+    if bitboard:
+        module = sys.modules[type(board).__module__]
+        board.board = module.BitBoard.from_rows(board.board)
+    return board
@@ -8,12 +8,13 @@
 
 
 """
+import collections
+import hashlib
 import io
 import itertools
 import os
 import sys
 import tempfile
-import unicodedata
 
 DRAUGHT, PAWN, ROOK, KNIGHT, BISHOP, KING, QUEEN = ("DRAUGHT", "PAWN",
         "ROOK", "KNIGHT", "BISHOP", "KING", "QUEEN")
@@ -44,29 +45,133 @@ else:
                 43 if background == BLACK else 47, char or " ")
 
 
+# Готовые строки клеток по (фигура, цвет клетки): console() вызывается
+# не больше одного раза для каждой пары
+_squares = {}
+
+
+def square(piece, background):
+    try:
+        return _squares[piece, background]
+    except KeyError:
+        text = _squares[piece, background] = console(piece, background)
+        return text
+
+
+_UNRENDERED = object()
+
+
+# Ключи Зобриста: для каждой пары (фигура, номер клетки) - 64-битное число,
+# выведенное из самой пары, поэтому ключи одинаковы во всех процессах.
+# Хеш позиции - XOR ключей всех занятых клеток
+_zobrist_keys = {}
+
+
+def zobrist_key(piece, square):
+    try:
+        return _zobrist_keys[piece, square]
+    except KeyError:
+        digest = hashlib.blake2b("{}{}".format(piece, square).encode("utf-8"),
+                digest_size=8).digest()
+        key = _zobrist_keys[piece, square] = int.from_bytes(digest, "big")
+        return key
+
+
 class AbstractBoard:
 
-    def __init__(self, rows, columns):
+    _shown = None
+
+    def __init__(self, rows, columns, bitboard=False):
         self.board = [[None for _ in range(columns)] for _ in range(rows)]
+        self.zobrist = 0
         self.populate_board()
+        if bitboard:
+            self.board = BitBoard.from_rows(self.board)
+
+    def copy(self):
+        board = object.__new__(type(self))
+        board.board = (self.board.copy() if isinstance(self.board, BitBoard)
+                       else [list(row) for row in self.board])
+        board.zobrist = self.zobrist
+        return board
+
+    def place(self, row, column, piece):
+        """
+        Ставит фигуру (или None) на клетку, обновляя хеш позиции; возвращает
+        прежнюю фигуру. Прямое присваивание self.board[row][column]
+        хеш не обновляет - после него нужно вызвать rehash()
+        """
+        cells = self.board[row]
+        square = row * len(cells) + column
+        old = cells[column]
+        if old is not None:
+            self.zobrist ^= zobrist_key(old, square)
+        if piece is not None:
+            self.zobrist ^= zobrist_key(piece, square)
+        cells[column] = piece
+        return old
+
+    def remove(self, row, column):
+        return self.place(row, column, None)
+
+    def rehash(self):
+        self.zobrist = 0
+        for y, row in enumerate(self.board):
+            for x, piece in enumerate(row):
+                if piece is not None:
+                    self.zobrist ^= zobrist_key(piece, y * len(row) + x)
+
+    def __eq__(self, other):
+        if not isinstance(other, AbstractBoard):
+            return NotImplemented
+        if (self.zobrist != other.zobrist or
+                len(self.board) != len(other.board)):
+            return False
+        if isinstance(self.board, BitBoard) and isinstance(other.board,
+                                                           BitBoard):
+            return self.board == other.board
+        return all(list(row) == list(other_row) for row, other_row in
+                   zip(self.board, other.board))
+
+    # Доска изменяемая, поэтому сама она не хешируется; ключ позиции - zobrist
+    __hash__ = None
 
     def populate_board(self):
         raise NotImplementedError()
 
     def __str__(self):
-        squares = []
+        """
+        Доска хранит то, что было выведено в прошлый раз, и заново
+        собирает только строки, в которых изменились фигуры
+        """
+        if self._shown is None or len(self._shown) != len(self.board):
+            self._shown = [[_UNRENDERED] * len(row) for row in self.board]
+            self._squares = [[None] * len(row) for row in self.board]
+            self._rows = [None] * len(self.board)
+            self._text = None
         for y, row in enumerate(self.board):
+            shown = self._shown[y]
+            if shown == row:
+                continue
+            squares = self._squares[y]
             for x, piece in enumerate(row):
-                square = console(piece, BLACK if (y + x) % 2 else WHITE)
-                squares.append(square)
-            squares.append("\n")
-        return "".join(squares)
+                if shown[x] is _UNRENDERED or shown[x] != piece:
+                    squares[x] = square(piece, BLACK if (y + x) % 2 else
+                            WHITE)
+                    shown[x] = piece
+            self._rows[y] = "".join(squares) + "\n"
+            self._text = None
+        if self._text is None:
+            self._text = "".join(self._rows)
+        return self._text
 
 
 class CheckersBoard(AbstractBoard):
 
-    def __init__(self):
+    def __init__(self, bitboard=False):
         self.populate_board()
+        if bitboard:
+            self.board = BitBoard.from_rows(self.board)
 
     def populate_board(self):
         def black():
@@ -81,30 +186,196 @@ class CheckersBoard(AbstractBoard):
                 (white(), None))            # 4 white rows
         self.board = [list(itertools.islice(
             itertools.cycle(squares), 0, len(rows))) for squares in rows]
+        self.rehash()
 
 
 class ChessBoard(AbstractBoard):
 
-    def __init__(self):
-        super().__init__(8, 8)
+    def __init__(self, bitboard=False):
+        super().__init__(8, 8, bitboard)
 
     def populate_board(self):
         for row, color in ((0, BLACK), (7, WHITE)):
             for columns, kind in (((0, 7), ROOK), ((1, 6), KNIGHT),
                     ((2, 5), BISHOP), ((3,), QUEEN), ((4,), KING)):
                 for column in columns:
-                    self.board[row][column] = create_piece(kind, color)
+                    self.place(row, column, create_piece(kind, color))
         for column in range(8):
             for row, color in ((1, BLACK), (6, WHITE)):
-                self.board[row][column] = create_piece(PAWN, color)
+                self.place(row, column, create_piece(PAWN, color))
+
+
+class BitBoard:
+    """
+    Компактное хранение доски: для каждой фигуры (а значит, каждого
+    сочетания вида и цвета) - одно целое число, в котором бит
+    row * columns + column установлен, если фигура стоит на этой клетке.
+    Числа лежат в списке masks по номеру символа фигуры в GLYPHS (тот же
+    порядок, что и в board_batch.GLYPHS), а сами фигуры - одни на все доски
+    в _piece_for_code. Поддерживает доступ board[row][column] как список
+    списков, поэтому populate_board() и __str__() работают с ним без
+    изменений, а копия доски - это копия списка из нескольких чисел
+    """
+    __slots__ = ("rows", "columns", "masks")
+
+    def __init__(self, rows, columns, masks=None):
+        self.rows = rows
+        self.columns = columns
+        self.masks = [0] * len(GLYPHS) if masks is None else list(masks)
+
+    @classmethod
+    def from_rows(cls, rows):
+        board = cls(len(rows), len(rows[0]) if rows else 0)
+        masks = board.masks
+        bit = 1
+        for pieces in rows:
+            for piece in pieces:
+                if piece is not None:
+                    code = _CODE_FOR_GLYPH[piece]
+                    masks[code] |= bit
+                    _piece_for_code[code] = piece
+                bit <<= 1
+        return board
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.rows:
+            raise IndexError("row index out of range")
+        return BitBoardRow(self, row)
+
+    def __iter__(self):
+        for row in range(self.rows):
+            yield BitBoardRow(self, row)
+
+    def __eq__(self, other):
+        if not isinstance(other, BitBoard):
+            return NotImplemented
+        return (self.rows == other.rows and self.columns == other.columns
+                and self.masks == other.masks)
+
+    def copy(self):
+        return BitBoard(self.rows, self.columns, self.masks)
+
+    def piece_at(self, row, column):
+        bit = 1 << (row * self.columns + column)
+        for code, mask in enumerate(self.masks):
+            if mask & bit:
+                return _piece_for_code[code]
+        return None
+
+    def place(self, row, column, piece):
+        bit = 1 << (row * self.columns + column)
+        masks = self.masks
+        for code, mask in enumerate(masks):
+            if mask & bit:
+                masks[code] = mask ^ bit
+                break
+        if piece is not None:
+            code = _CODE_FOR_GLYPH[piece]
+            masks[code] |= bit
+            _piece_for_code[code] = piece
+
+    def row_pieces(self, row):
+        pieces = [None] * self.columns
+        shift = row * self.columns
+        row_mask = (1 << self.columns) - 1
+        for code, mask in enumerate(self.masks):
+            bits = (mask >> shift) & row_mask
+            if bits:
+                piece = _piece_for_code[code]
+                while bits:
+                    lowest = bits & -bits
+                    pieces[lowest.bit_length() - 1] = piece
+                    bits ^= lowest
+        return pieces
+
+
+class BitBoardRow:
+    __slots__ = ("board", "row")
+
+    def __init__(self, board, row):
+        self.board = board
+        self.row = row
+
+    def __len__(self):
+        return self.board.columns
+
+    def __getitem__(self, column):
+        if not 0 <= column < self.board.columns:
+            raise IndexError("column index out of range")
+        return self.board.piece_at(self.row, column)
+
+    def __setitem__(self, column, piece):
+        if not 0 <= column < self.board.columns:
+            raise IndexError("column index out of range")
+        self.board.place(self.row, column, piece)
+
+    def __iter__(self):
+        return iter(self.board.row_pieces(self.row))
+
+    def __eq__(self, other):
+        return self.board.row_pieces(self.row) == list(other)
+
+
+class TranspositionTable:
+    """
+    Ограниченная LRU-таблица результатов анализа позиций по хешу Зобриста.
+    Ключом может быть доска или ее хеш (board.zobrist)
+    """
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, board):
+        return _position_key(board) in self._entries
+
+    def get(self, board, default=None):
+        key = _position_key(board)
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, board, value):
+        key = _position_key(board)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+def _position_key(board):
+    return board if isinstance(board, int) else board.zobrist
+
+
+# Фигуры не имеют состояния, поэтому каждая создается один раз и затем
+# разделяется всеми досками (паттерн Приспособленец)
+_pieces = {}
 
 
 def create_piece(kind, color):
-    color = "White" if color == WHITE else "Black"
+    try:
+        return _pieces[kind, color]
+    except KeyError:
+        pass
     name = {DRAUGHT: "Draught", PAWN: "ChessPawn", ROOK: "ChessRook",
             KNIGHT: "ChessKnight", BISHOP: "ChessBishop",
             KING: "ChessKing", QUEEN: "ChessQueen"}[kind]
-    return globals()[color + name]()
+    piece = _piece_class(("White" if color == WHITE else "Black") + name)()
+    _pieces[kind, color] = piece
+    return piece
 
 
 class Piece(str):
@@ -112,15 +383,46 @@ class Piece(str):
     __slots__ = ()
 
 
-for code in itertools.chain((0x26C0, 0x26C2), range(0x2654, 0x2660)):
-    char = chr(code)
-    name = unicodedata.name(char).title().replace(" ", "")
-    if name.endswith("sMan"):
-        name = name[:-4]
-    new = (lambda char: lambda Class: Piece.__new__(Class, char))(char)
-    new.__name__ = "__new__"
-    Class = type(name, (Piece,), dict(__slots__=(), __new__=new))
-    globals()[name] = Class
+# Имена классов фигур и их символы вычислены заранее (раньше они строились
+# при импорте через unicodedata.name()), а сами классы создаются при первом
+# обращении - из create_piece() или как атрибут модуля (см. __getattr__)
+PIECE_CHARS = {
+    "WhiteDraught": "\N{WHITE DRAUGHTS MAN}",
+    "BlackDraught": "\N{BLACK DRAUGHTS MAN}",
+    "WhiteChessKing": "\N{WHITE CHESS KING}",
+    "WhiteChessQueen": "\N{WHITE CHESS QUEEN}",
+    "WhiteChessRook": "\N{WHITE CHESS ROOK}",
+    "WhiteChessBishop": "\N{WHITE CHESS BISHOP}",
+    "WhiteChessKnight": "\N{WHITE CHESS KNIGHT}",
+    "WhiteChessPawn": "\N{WHITE CHESS PAWN}",
+    "BlackChessKing": "\N{BLACK CHESS KING}",
+    "BlackChessQueen": "\N{BLACK CHESS QUEEN}",
+    "BlackChessRook": "\N{BLACK CHESS ROOK}",
+    "BlackChessBishop": "\N{BLACK CHESS BISHOP}",
+    "BlackChessKnight": "\N{BLACK CHESS KNIGHT}",
+    "BlackChessPawn": "\N{BLACK CHESS PAWN}",
+}
+GLYPHS = tuple(PIECE_CHARS.values())
+_CODE_FOR_GLYPH = {glyph: code for code, glyph in enumerate(GLYPHS)}
+_piece_for_code = [None] * len(GLYPHS)
+
+
+def _piece_class(name):
+    Class = globals().get(name)
+    if Class is None:
+        char = PIECE_CHARS[name]
+        new = (lambda char: lambda Class: Piece.__new__(Class, char))(char)
+        new.__name__ = "__new__"
+        Class = type(name, (Piece,), dict(__slots__=(), __new__=new))
+        globals()[name] = Class
+    return Class
+
+
+def __getattr__(name):
+    if name in PIECE_CHARS:
+        return _piece_class(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__,
+                         name))
 
 
 if __name__ == "__main__":
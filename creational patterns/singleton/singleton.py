@@ -6,27 +6,457 @@
 которое хранится в закрытых переменных, и предоставить открытые функции для доступа к ним.
 """
 
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import itertools
+import os
 import sqlite3
+import threading
+import time
 
 
 class MetaSingleton(type):
+    """
+    Экземпляр создается при первом вызове класса. Проверка выполняется дважды:
+    без блокировки (быстрый путь) и повторно под блокировкой, чтобы два потока
+    не создали два объекта.
+
+    Если класс определяет singleton_key(*args, **kwargs), то экземпляров
+    будет по одному на каждый ключ, например на каждый путь к базе данных.
+    Если он определяет и singleton_check(*args, **kwargs), то при повторном
+    вызове класса этот метод уже созданного экземпляра проверяет, что
+    аргументы не противоречат его настройкам.
+
+    В дочернем процессе после os.fork() реестр очищается, и объекты
+    создаются заново, а не наследуются от родителя
+    """
     _instances = {}
+    _lock = threading.RLock()
+    _inherited = []
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(MetaSingleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+        key_for = getattr(cls, "singleton_key", None)
+        key = (cls, None if key_for is None else key_for(*args, **kwargs))
+        instance = cls._instances.get(key)
+        if instance is None:
+            with MetaSingleton._lock:
+                instance = cls._instances.get(key)
+                if instance is None:
+                    instance = super(MetaSingleton, cls).__call__(*args,
+                            **kwargs)
+                    cls._instances[key] = instance
+                    return instance
+        check = getattr(instance, "singleton_check", None)
+        if check is not None:
+            check(*args, **kwargs)
+        return instance
+
+    def _existing(cls, *args, **kwargs):
+        """Уже созданный экземпляр для этих аргументов или None, без проверок"""
+        key_for = getattr(cls, "singleton_key", None)
+        return cls._instances.get((cls, None if key_for is None else
+                                   key_for(*args, **kwargs)))
+
+    def _release(cls, instance):
+        """Убирает закрытый экземпляр из реестра: следующий вызов создаст новый"""
+        with MetaSingleton._lock:
+            for key, value in list(cls._instances.items()):
+                if value is instance:
+                    del cls._instances[key]
+
+    @staticmethod
+    def _reset_after_fork():
+        # Объекты родителя не удаляются: их сборка мусора закрыла бы
+        # унаследованные соединения, которые все еще использует родитель
+        MetaSingleton._inherited.extend(MetaSingleton._instances.values())
+        MetaSingleton._instances.clear()
+        MetaSingleton._lock = threading.RLock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=MetaSingleton._reset_after_fork)
 
 
 class Database(metaclass=MetaSingleton):
+    """
+    insert_many() и upsert_many() записывают строки пачками по batch_size:
+    одна транзакция и один вызов executemany() на пачку. Подготовленные
+    выражения кеширует сам sqlite3 (LRU по тексту SQL, размер задается
+    cached_statements), а текст SQL для каждой таблицы и набора столбцов
+    строится один раз. Если для пути уже есть DatabasePool, пачки пишутся
+    через его соединение с его настройками, иначе - через собственное
+    соединение объекта.
+    rows_written и write_seconds накапливают статистику
+    """
     connection = None
 
+    def __init__(self, path="db.sqlite3", cached_statements=256):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    @staticmethod
+    def singleton_key(path="db.sqlite3", *args, **kwargs):
+        return path
+
+    def singleton_check(self, path="db.sqlite3", cached_statements=None):
+        _check_settings(self, cached_statements=cached_statements)
+
     def connect(self):
         if self.connection is None:
-            self.connection = sqlite3.connect("db.sqlite3")
-            self.cursorobj = self.connection.cursor()
+            with self._lock:
+                if self.connection is None:
+                    self.cursorobj = sqlite3.connect(self.path,
+                            cached_statements=self.cached_statements).cursor()
+                    self.connection = self.cursorobj.connection
         return self.cursorobj
 
+    def insert_many(self, table, columns, rows, batch_size=1000):
+        return self._write_many(_insert_sql(table, tuple(columns)), rows,
+                batch_size)
+
+    def upsert_many(self, table, columns, rows, keys, batch_size=1000):
+        return self._write_many(_insert_sql(table, tuple(columns),
+                tuple(keys)), rows, batch_size)
+
+    @property
+    def rows_per_second(self):
+        if not self.write_seconds:
+            return 0.0
+        return self.rows_written / self.write_seconds
+
+    def _write_many(self, sql, rows, batch_size):
+        rows = iter(rows)
+        count = 0
+        with self._write_connection() as connection:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                start = time.perf_counter()
+                with connection:
+                    connection.executemany(sql, batch)
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.write_seconds += elapsed
+                    self.rows_written += len(batch)
+                count += len(batch)
+        return count
+
+    def pool(self, **kwargs):
+        return DatabasePool(self.path, **kwargs)
+
+    @contextlib.contextmanager
+    def _write_connection(self):
+        # Соединение из connect() привязано к создавшему его потоку, поэтому
+        # пачки пишутся через соединение, которое можно брать из любого
+        # потока. Существующий пул используется как есть, без проверки
+        # настроек, а новый не создается, чтобы не навязать пулу настройки
+        # по умолчанию раньше, чем его настроит вызывающий код
+        pool = DatabasePool._existing(self.path)
+        if pool is not None:
+            with pool.connection() as connection:
+                yield connection
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = sqlite3.connect(self.path,
+                        check_same_thread=False,
+                        cached_statements=self.cached_statements)
+            yield self._writer
+
+
+class AsyncDatabase(metaclass=MetaSingleton):
+    """
+    Асинхронный интерфейс к DatabasePool: запросы выполняются в отдельном
+    пуле потоков, поэтому цикл событий не блокируется на дисковом вводе-выводе.
+
+    Одновременно выполняется не больше pool.size операций во всех циклах
+    событий вместе, остальные ждут в очереди _Slots, не занимая потоков, -
+    это и есть ограничение нагрузки. Соединения берутся из общего
+    DatabasePool, поэтому пока Database.insert_many() и другие пользователи
+    пула держат соединения, операция может ждать их не дольше pool.timeout.
+    При отмене задачи выполняющийся запрос прерывается connection.interrupt().
+    fetch_iter() читает строки пачками по batch_size и запрашивает следующую
+    пачку, только когда предыдущая прочитана.
+    После close() объект удаляется из реестра одиночек
+    """
+
+    def __init__(self, path="db.sqlite3", *args, **kwargs):
+        self.pool = DatabasePool(path, *args, **kwargs)
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.pool.size,
+                thread_name_prefix="AsyncDatabase")
+        self._slots = _Slots(self.pool.size)
+
+    @staticmethod
+    def singleton_key(path="db.sqlite3", *args, **kwargs):
+        return path
+
+    def singleton_check(self, path="db.sqlite3", *args, **kwargs):
+        self.pool.singleton_check(path, *args, **kwargs)
+
+    async def execute(self, sql, parameters=()):
+        return await self._run(_execute, sql, parameters)
+
+    async def fetchall(self, sql, parameters=()):
+        return await self._run(_fetchall, sql, parameters)
+
+    async def fetch_iter(self, sql, parameters=(), batch_size=500):
+        async with self._slots:
+            connection = await self._checkout()
+            future = None
+            try:
+                future = self._executor.submit(connection.execute, sql,
+                        parameters)
+                cursor = await self._wait(future, connection)
+                while True:
+                    future = self._executor.submit(cursor.fetchmany,
+                            batch_size)
+                    rows = await self._wait(future, connection)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+            finally:
+                self._checkin_after(future, connection)
+
+    def close(self):
+        type(self)._release(self)
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    async def _run(self, function, *args):
+        async with self._slots:
+            connection = await self._checkout()
+            future = self._executor.submit(function, connection, *args)
+            self._checkin_after(future, connection)
+            return await self._wait(future, connection)
+
+    async def _checkout(self):
+        future = self._executor.submit(self.pool._checkout)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda future: not future.cancelled()
+                    and future.exception() is None
+                    and self.pool._checkin(future.result()))
+            raise
+
+    def _checkin_after(self, future, connection):
+        # Соединение возвращается в пул только после того, как поток
+        # закончил работу с ним, даже если ожидавшая задача уже отменена
+        if future is None or future.done():
+            self.pool._checkin(connection)
+        else:
+            future.add_done_callback(lambda _: self.pool._checkin(connection))
+
+    @staticmethod
+    async def _wait(future, connection):
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.done():
+                connection.interrupt()
+            raise
+
+
+class _Slots:
+    """
+    Асинхронный семафор, общий для всех циклов событий: asyncio.Semaphore
+    привязан к одному циклу, а threading.Semaphore заблокировал бы цикл.
+    Освободившееся место сразу передается первому ожидающему под
+    блокировкой, а его цикл будится через call_soon_threadsafe()
+    """
+
+    def __init__(self, size):
+        self._free = size
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(future)
+                    granted = False
+                except ValueError:
+                    granted = True
+            if granted:
+                self._release()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            while self._waiters:
+                future = self._waiters.popleft()
+                try:
+                    future.get_loop().call_soon_threadsafe(_wake, future)
+                except RuntimeError: # Цикл ожидающего уже закрыт
+                    continue
+                return
+            self._free += 1
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _execute(connection, sql, parameters):
+    with connection:
+        return connection.execute(sql, parameters).rowcount
+
+
+def _fetchall(connection, sql, parameters):
+    return connection.execute(sql, parameters).fetchall()
+
+
+def _check_settings(instance, **settings):
+    # None означает, что настройка не передана и подходит любая
+    for name, value in settings.items():
+        if value is not None and value != getattr(instance, name):
+            raise ValueError("{} for {} already exists with {}={!r}, "
+                    "not {!r}".format(type(instance).__name__, instance.path,
+                    name, getattr(instance, name), value))
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+@functools.lru_cache(maxsize=256)
+def _insert_sql(table, columns, keys=None):
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(_quote(table),
+            ", ".join(map(_quote, columns)), ", ".join("?" * len(columns)))
+    if keys is not None:
+        updates = ", ".join("{0} = excluded.{0}".format(_quote(column))
+                for column in columns if column not in keys)
+        sql += " ON CONFLICT ({}) DO {}".format(", ".join(map(_quote, keys)),
+                "UPDATE SET " + updates if updates else "NOTHING")
+    return sql
+
+
+class DatabasePool(metaclass=MetaSingleton):
+    """
+    Пул из не более чем size соединений с одной базой, по одному пулу на путь.
+    Соединение выдается на время блока with pool.connection() as connection,
+    если свободных нет - ожидание длится не дольше timeout секунд.
+
+    Соединение, простоявшее без дела дольше ping_interval, перед выдачей
+    проверяется запросом SELECT 1 и при ошибке открывается заново.
+    Режим WAL включается только явно (wal=True). cached_statements -
+    размер кеша подготовленных выражений каждого соединения
+    """
+
+    def __init__(self, path="db.sqlite3", size=5, timeout=5.0,
+            ping_interval=30.0, wal=False, cached_statements=256):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.wal = wal
+        self.cached_statements = cached_statements
+        self._idle = collections.deque()
+        self._opened = 0
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def singleton_key(path="db.sqlite3", *args, **kwargs):
+        return path
+
+    def singleton_check(self, path="db.sqlite3", size=None, timeout=None,
+            ping_interval=None, wal=None, cached_statements=None):
+        _check_settings(self, size=size, timeout=timeout,
+                ping_interval=ping_interval, wal=wal,
+                cached_statements=cached_statements)
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self._checkout()
+        try:
+            yield connection
+        finally:
+            self._checkin(connection)
+
+    def close(self):
+        with self._condition:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                connection.close()
+                self._opened -= 1
+            self._condition.notify_all()
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while not self._idle and self._opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("no connection to {} became free "
+                            "within {}s".format(self.path, self.timeout))
+                self._condition.wait(remaining)
+            if self._idle:
+                connection, last_used = self._idle.pop()
+            else:
+                connection, last_used = None, None
+                self._opened += 1
+        try:
+            if connection is None:
+                return self._open()
+            if time.monotonic() - last_used > self.ping_interval:
+                try:
+                    connection.execute("SELECT 1").fetchone()
+                except sqlite3.Error:
+                    connection.close()
+                    return self._open()
+            return connection
+        except BaseException:
+            self._discard()
+            raise
+
+    def _checkin(self, connection):
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            connection.close()
+            self._discard()
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def _discard(self):
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                check_same_thread=False,
+                cached_statements=self.cached_statements)
+        if self.wal:
+            connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
 
 db1 = Database().connect()
 db2 = Database().connect()
@@ -0,0 +1,34 @@
+"""
+Сравнение textwrap.fill с render1.fill и с WrapCache на абзацах,
+которые часто повторяются, как шаблонные абзацы в отчетах
+"""
+import random
+import textwrap
+import timeit
+
+import render1
+
+
+WORDS = ("the", "report", "is", "provided", "for", "information",
+         "purposes", "only", "and", "does", "not", "constitute", "advice")
+
+
+def main():
+    rng = random.Random(0)
+    templates = [" ".join(rng.choice(WORDS) for _ in range(rng.randrange(20,
+                 80))) for _ in range(50)]
+    paragraphs = [rng.choice(templates) for _ in range(5000)]
+    width = 72
+    cache = render1.WrapCache()
+
+    for name, function in (("textwrap.fill", textwrap.fill),
+            ("render1.fill", render1.fill), ("WrapCache.fill", cache.fill)):
+        seconds = min(timeit.repeat(lambda: [function(text, width)
+                      for text in paragraphs], number=1, repeat=5))
+        print("{:15} {:8.2f}us per paragraph".format(name,
+              seconds / len(paragraphs) * 1e6))
+    print("cache hits {} misses {}".format(cache.hits, cache.misses))
+
+
+if __name__ == "__main__":
+    main()
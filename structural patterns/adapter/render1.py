@@ -8,8 +8,13 @@
 """
 import abc
 import collections
+import concurrent.futures
+import io
+import itertools
+import re
 import sys
 import textwrap
+import threading
 if sys.version_info[:2] < (3, 2):
     from xml.sax.saxutils import escape
 else:
@@ -94,34 +99,264 @@ class Page:
     def add_paragraph(self, paragraph):
         self.paragraphs.append(paragraph)
 
-    def render(self):
+    def render(self, paragraphs=None):
+        """
+        paragraphs - любой итерируемый источник абзацев (например, генератор,
+        читающий их из файла); если он не задан, выводятся self.paragraphs.
+        Если у визуализатора есть метод paragraphs(), абзацы передаются ему
+        все сразу, а метод flush() вызывается один раз в конце страницы
+        """
         self.renderer.header(self.title)
-        for paragraph in self.paragraphs:
-            self.renderer.paragraph(paragraph)
+        if paragraphs is None:
+            paragraphs = self.paragraphs
+        render_many = getattr(self.renderer, "paragraphs", None)
+        if render_many is not None:
+            render_many(paragraphs)
+        else:
+            for paragraph in paragraphs:
+                self.renderer.paragraph(paragraph)
         self.renderer.footer()
+        flush = getattr(self.renderer, "flush", None)
+        if flush is not None:
+            flush()
+
+
+def render_pages(pages, sources=None, max_workers=None):
+    """
+    Выводит несколько страниц одновременно. У каждой страницы должен быть
+    свой визуализатор со своим файлом, например BufferedFile(open(...)).
+    sources - необязательные источники абзацев, по одному на страницу
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        if sources is None:
+            futures = [executor.submit(page.render) for page in pages]
+        else:
+            futures = [executor.submit(page.render, paragraphs)
+                       for page, paragraphs in zip(pages, sources)]
+        for future in futures:
+            future.result()
+
+
+def render_formats(page, targets, paragraphs=None, executor=None):
+    """
+    Выводит одну страницу сразу в нескольких форматах.
+    targets - пары (make_renderer, file), где make_renderer(file) создает
+    визуализатор, например functools.partial(TextRenderer, 72) или
+    make_html_renderer. Каждый формат пишет в свой BufferedFile.
+
+    Без executor абзацы читаются один раз и раздаются всем форматам через
+    MultiRenderer. С executor (например, ProcessPoolExecutor) каждый формат
+    собирается в отдельной задаче, а результат записывается в его файл;
+    make_renderer в этом случае должен поддерживать pickle
+    """
+    if paragraphs is None:
+        paragraphs = page.paragraphs
+    if executor is None:
+        renderer = MultiRenderer(*(make_renderer(BufferedFile(file))
+                                   for make_renderer, file in targets))
+        Page(page.title, renderer).render(paragraphs)
+        return
+    paragraphs = list(paragraphs)
+    futures = [(executor.submit(_render_to_string, make_renderer, page.title,
+                paragraphs), file) for make_renderer, file in targets]
+    for future, file in futures:
+        file.write(future.result())
+        _flush(file)
+
+
+def _render_to_string(make_renderer, title, paragraphs):
+    file = io.StringIO()
+    Page(title, make_renderer(file)).render(paragraphs)
+    return file.getvalue()
+
+
+def make_html_renderer(file):
+    return HtmlRenderer(HtmlWriter(file))
+
+
+class MultiRenderer:
+    """
+    Передает каждый вызов всем своим визуализаторам, поэтому источник
+    абзацев обходится один раз для всех форматов
+    """
+
+    def __init__(self, *renderers):
+        self.renderers = renderers
+
+    def header(self, title):
+        for renderer in self.renderers:
+            renderer.header(title)
+
+    def paragraph(self, text):
+        for renderer in self.renderers:
+            renderer.paragraph(text)
+
+    def paragraphs(self, texts):
+        texts = iter(texts)
+        while True:
+            batch = list(itertools.islice(texts, HTML_BATCH_SIZE))
+            if not batch:
+                break
+            for renderer in self.renderers:
+                render_many = getattr(renderer, "paragraphs", None)
+                if render_many is not None:
+                    render_many(batch)
+                else:
+                    for text in batch:
+                        renderer.paragraph(text)
+
+    def footer(self):
+        for renderer in self.renderers:
+            renderer.footer()
+
+    def flush(self):
+        for renderer in self.renderers:
+            flush = getattr(renderer, "flush", None)
+            if flush is not None:
+                flush()
+
+
+def _flush(file):
+    # Визуализаторам достаточно файла с одним методом write(), как и раньше
+    flush = getattr(file, "flush", None)
+    if flush is not None:
+        flush()
+
+
+class BufferedFile:
+    """
+    Накапливает все записи страницы в памяти и передает их файлу одним
+    вызовом write() при flush()
+    """
+
+    def __init__(self, file=sys.stdout):
+        self.file = file
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        return len(text)
+
+    def writelines(self, lines):
+        self.parts.extend(lines)
+
+    def flush(self):
+        if self.parts:
+            self.file.write("".join(self.parts))
+            self.parts.clear()
+        _flush(self.file)
+
+
+# Символы, при которых textwrap ведет себя иначе, чем простое разбиение по
+# пробелам: переносы по дефису, табуляция и разделители \x1c-\x1f, которые
+# str.split() считает пробельными, а textwrap - нет
+_UNSAFE_FOR_FAST_FILL = re.compile(r"[-\t\x1c-\x1f]")
+
+
+def fill(text, width):
+    """
+    Тот же результат, что и textwrap.fill(text, width), но для простого
+    ASCII-текста - без регулярных выражений textwrap: жадное заполнение строк
+    словами из str.split(). Остальной текст передается textwrap.fill()
+    """
+    if (width > 0 and text.isascii() and
+            _UNSAFE_FOR_FAST_FILL.search(text) is None):
+        words = text.split()
+        # Между словами ровно один пробельный символ, нет пробелов по краям
+        # и ни одно слово не придется разрывать
+        if (len(" ".join(words)) == len(text) and
+                max(map(len, words), default=0) <= width):
+            lines = []
+            line = []
+            length = -1
+            for word in words:
+                if length + 1 + len(word) > width and line:
+                    lines.append(" ".join(line))
+                    line = [word]
+                    length = len(word)
+                else:
+                    line.append(word)
+                    length += 1 + len(word)
+            if line:
+                lines.append(" ".join(line))
+            return "\n".join(lines)
+    return textwrap.fill(text, width)
+
+
+class WrapCache:
+    """
+    Ограниченный LRU-кеш результатов fill() по ключу (text, width).
+    hits и misses - статистика обращений. Один кеш могут использовать
+    визуализаторы из разных потоков, например в render_pages()
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def fill(self, text, width):
+        key = (text, width)
+        with self._lock:
+            wrapped = self._cache.get(key)
+            if wrapped is not None:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return wrapped
+            self.misses += 1
+        # Перенос строк выполняется вне блокировки
+        wrapped = fill(text, width)
+        with self._lock:
+            self._cache[key] = wrapped
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return wrapped
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+
+# Кеш по умолчанию общий для всех TextRenderer: у каждой страницы свой
+# визуализатор, а повторяются абзацы (подписи, оговорки) между страницами
+wrap_cache = WrapCache()
 
 
 class TextRenderer:
 
-    def __init__(self, width=80, file=sys.stdout):
+    def __init__(self, width=80, file=sys.stdout, wrapCache=None):
         self.width = width
         self.file = file
+        self.wrapCache = wrap_cache if wrapCache is None else wrapCache
         self.previous = False
 
     def header(self, title):
+        self.previous = False
         self.file.write("{0:^{2}}\n{1:^{2}}\n".format(title,
                 "=" * len(title), self.width))
 
     def paragraph(self, text):
-        if self.previous:
-            self.file.write("\n")
-        self.file.write(textwrap.fill(text, self.width))
-        self.file.write("\n")
+        self.file.write("{}{}\n".format("\n" if self.previous else "",
+                self.wrapCache.fill(text, self.width)))
         self.previous = True
 
     def footer(self):
         pass
 
+    def flush(self):
+        _flush(self.file)
+
+
+HTML_TITLE = "<head><title>{}</title></head>\n".format
+HTML_PARAGRAPH = "<p>{}</p>\n".format
+HTML_BATCH_SIZE = 1024
+
 
 class HtmlWriter:
 
@@ -132,14 +367,31 @@ class HtmlWriter:
         self.file.write("<!doctype html>\n<html>\n")
 
     def title(self, title):
-        self.file.write("<head><title>{}</title></head>\n".format(
-                escape(title)))
+        self.file.write(HTML_TITLE(escape(title)))
 
     def start_body(self):
         self.file.write("<body>\n")
 
     def body(self, text):
-        self.file.write("<p>{}</p>\n".format(escape(text)))
+        self.file.write(HTML_PARAGRAPH(escape(text)))
+
+    def bodies(self, texts):
+        """
+        Пачка абзацев склеивается через \0, экранируется одним вызовом
+        escape() и размечается одной заменой разделителя на "</p>\n<p>"
+        """
+        texts = iter(texts)
+        while True:
+            batch = list(itertools.islice(texts, HTML_BATCH_SIZE))
+            if not batch:
+                break
+            text = "\0".join(batch)
+            if text.count("\0") != len(batch) - 1:
+                self.file.write("".join(HTML_PARAGRAPH(escape(paragraph))
+                                        for paragraph in batch))
+                continue
+            self.file.write("<p>{}</p>\n".format(escape(text).replace("\0",
+                    "</p>\n<p>")))
 
     def end_body(self):
         self.file.write("</body>\n")
@@ -147,6 +399,9 @@ class HtmlWriter:
     def footer(self):
         self.file.write("</html>\n")
 
+    def flush(self):
+        _flush(self.file)
+
 
 class HtmlRenderer:
 
@@ -161,10 +416,16 @@ class HtmlRenderer:
     def paragraph(self, text):
         self.htmlWriter.body(text)
 
+    def paragraphs(self, texts):
+        self.htmlWriter.bodies(texts)
+
     def footer(self):
         self.htmlWriter.end_body()
         self.htmlWriter.footer()
 
+    def flush(self):
+        self.htmlWriter.flush()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
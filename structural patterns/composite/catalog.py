@@ -0,0 +1,107 @@
+"""
+Потоковая загрузка каталога из списка ребер (parent, child, price).
+
+Файл читается за один проход: каждая строка сразу превращается в элемент и
+добавляется к уже загруженному родителю, поэтому в памяти хранится только
+построенное дерево и словарь имен, но не исходные строки.
+
+Правила формата:
+- родитель должен встретиться раньше своих детей, пустой parent - корень
+- каждый child встречается один раз
+- пустая цена означает набор (составной элемент), иначе - простой элемент
+
+CSV: столбцы parent,child,price (строка заголовка необязательна)
+JSONL: по одному объекту {"parent": ..., "child": ..., "price": ...} в строке
+"""
+import csv
+import json
+import os
+
+CSV, JSONL = ("csv", "jsonl")
+HEADER = ["parent", "child", "price"]
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def load(filenameOrFile, make_item, make_composite, format=None):
+    """
+    make_item(name, price) и make_composite(name) создают элементы,
+    дети добавляются вызовом parent.add(child). Возвращает список корней
+    """
+    if format is None:
+        format = JSONL if (isinstance(filenameOrFile, str) and
+                os.path.splitext(filenameOrFile)[1].lower() in
+                (".jsonl", ".ndjson")) else CSV
+    reader = {CSV: _read_csv, JSONL: _read_jsonl}[format]
+    file = None if isinstance(filenameOrFile, str) else filenameOrFile
+    try:
+        if file is None:
+            file = open(filenameOrFile, encoding="utf-8", newline="")
+        return _build(reader(file), make_item, make_composite)
+    finally:
+        if isinstance(filenameOrFile, str) and file is not None:
+            file.close()
+
+
+def _read_csv(file):
+    for line, row in enumerate(csv.reader(file), 1):
+        if not row or (line == 1 and row == HEADER):
+            continue
+        if len(row) != 3:
+            raise CatalogError("line {}: expected 3 fields, got {}".format(
+                    line, len(row)))
+        yield line, row[0], row[1], row[2]
+
+
+def _read_jsonl(file):
+    for line, text in enumerate(file, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+            yield line, row.get("parent") or "", row["child"], row.get("price")
+        except (ValueError, KeyError, AttributeError) as err:
+            raise CatalogError("line {}: {}".format(line, err)) from err
+
+
+def _build(rows, make_item, make_composite):
+    items = {}
+    parent_of = {}
+    bundles = set()
+    roots = []
+    for line, parent_name, name, price in rows:
+        if name in items or name == parent_name:
+            ancestor = parent_name
+            while ancestor:
+                if ancestor == name:
+                    raise CatalogError("line {}: adding {!r} to {!r} creates "
+                            "a cycle".format(line, name, parent_name))
+                ancestor = parent_of.get(ancestor)
+            raise CatalogError("line {}: duplicate item {!r}".format(line,
+                    name))
+        parent = None
+        if parent_name:
+            parent = items.get(parent_name)
+            if parent is None:
+                raise CatalogError("line {}: unknown parent {!r}".format(line,
+                        parent_name))
+            if parent_name not in bundles:
+                raise CatalogError("line {}: {!r} is not a bundle".format(
+                        line, parent_name))
+        if price is None or price == "":
+            item = make_composite(name)
+            bundles.add(name)
+        else:
+            try:
+                item = make_item(name, float(price))
+            except (TypeError, ValueError) as err:
+                raise CatalogError("line {}: {}".format(line, err)) from err
+        items[name] = item
+        if parent is None:
+            roots.append(item)
+        else:
+            parent.add(item)
+            parent_of[name] = parent_name
+    return roots
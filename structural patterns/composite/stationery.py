@@ -19,6 +19,9 @@
 import abc
 import sys
 
+import catalog
+from treeprint import write_tree
+
 
 def main():
     pencil = SimpleItem("Pencil", 0.40)
@@ -37,7 +40,13 @@ class AbstractItem(metaclass=abc.ABCMeta):
     1. Метод __iter__ отвечает за итерируемость подкласса.
     2. Поскольку абстрактній класс имеет по меньшей мере один абстрактній метод или свойство,
         создавать обїект класса AbstractItem нельзя
+    3. parents - составные объекты, в которые добавлен элемент. По этим ссылкам
+        изменение цены поднимается вверх по дереву и сбрасывает закешированные
+        суммы родителей, поэтому переоценка одного листа стоит O(глубины)
     """
+    def __init__(self):
+        self.parents = []
+
     @property
     @abc.abstractmethod
     def composite(self):
@@ -46,19 +55,38 @@ class AbstractItem(metaclass=abc.ABCMeta):
     def __iter__(self):
         return iter([])
 
+    def _invalidate_parents(self):
+        # Обход без рекурсии: подъем останавливается на предках, чьи суммы
+        # уже сброшены - тогда сброшены и суммы всех их предков
+        stack = list(self.parents)
+        while stack:
+            item = stack.pop()
+            if item._price is not None:
+                item._price = None
+                stack.extend(item.parents)
+
 
 class SimpleItem(AbstractItem):
     def __init__(self, name, price=0.00):
+        super().__init__()
         self.name = name
-        self.price = price
+        self.__price = price
 
     @property
     def composite(self):
         return False
 
+    @property
+    def price(self):
+        return self.__price
+
+    @price.setter
+    def price(self, price):
+        self.__price = price
+        self._invalidate_parents()
+
     def print(self, indent="", file=sys.stdout):
-        print("{}${:.2f} {}".format(indent, self.price, self.name),
-              file=file)
+        write_tree(self, indent, file)
 
 
 class AbstractCompositeItem(AbstractItem):
@@ -67,7 +95,9 @@ class AbstractCompositeItem(AbstractItem):
     но не реализует его
     """
     def __init__(self, *items):
+        super().__init__()
         self.children = []
+        self._price = None
         if items:
             self.add(*items)
 
@@ -75,9 +105,24 @@ class AbstractCompositeItem(AbstractItem):
         self.children.append(first)
         if items:
             self.children.extend(items)
+        for item in (first,) + items:
+            item.parents.append(self)
+        self._invalidate()
 
     def remove(self, item):
         self.children.remove(item)
+        item.parents.remove(self)
+        self._invalidate()
+
+    def _invalidate(self):
+        """
+        Если сумма уже сброшена, то сброшены и суммы всех предков:
+        пересчет родителя всегда пересчитывает детей, поэтому подъем
+        можно остановить
+        """
+        if self._price is not None:
+            self._price = None
+            self._invalidate_parents()
 
     def __iter__(self):
         return iter(self.children)
@@ -98,14 +143,46 @@ class CompositeItem(AbstractCompositeItem):
         for item in self : интерпретатор Python вызывает iter(self), чтобы получить
         итератор для self -> происходит вызов метода __iter__(), возвращающий итератор,
         указывающий на self.children
+
+        Сумма кешируется до следующего add(), remove() или изменения цены
+        любого из потомков
         """
-        return sum(item.price for item in self)
+        if self._price is None:
+            self._update_prices()
+        return self._price
+
+    def _update_prices(self):
+        # Обход без рекурсии: составной элемент снимается со стека только
+        # после того, как посчитаны суммы всех его составных детей.
+        # В path лежат элементы, ждущие своих детей, - это предки текущего
+        # элемента, и встретить одного из них среди детей значит найти цикл
+        stack = [self]
+        path = set()
+        while stack:
+            item = stack[-1]
+            if item._price is not None:
+                stack.pop()
+                continue
+            pending = [child for child in item
+                       if child.composite and child._price is None]
+            if pending:
+                for child in pending:
+                    if child in path:
+                        raise ValueError("{} contains itself".format(
+                                child.name))
+                path.add(item)
+                stack.extend(pending)
+            else:
+                item._price = sum(child.price for child in item)
+                path.discard(item)
+                stack.pop()
 
     def print(self, indent="", file=sys.stdout):
-        print("{}${:.2f} {}".format(indent, self.price, self.name),
-              file=file)
-        for child in self:
-            child.print(indent + "      ")
+        write_tree(self, indent, file)
+
+
+def load_catalog(filenameOrFile, format=None):
+    return catalog.load(filenameOrFile, SimpleItem, CompositeItem, format)
 
 
 if __name__ == "__main__":
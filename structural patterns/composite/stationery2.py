@@ -1,5 +1,15 @@
+import array
 import itertools
 import sys
+# numpy - необязательная зависимость (pip install numpy): с ней
+# ItemStore.totals() считает суммы векторно, без нее - циклом Python
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import catalog
+import treeprint
 
 
 def main():
@@ -33,11 +43,15 @@ class Item:
             self.add(*items)
 
     @classmethod
-    def create(cls, name, price):
+    def create(cls, name, price, store=None):
+        if store is not None:
+            return store.create(name, price)
         return Item(name, price=price)
 
     @classmethod
-    def compose(cls, name, *items):
+    def compose(cls, name, *items, store=None):
+        if store is not None:
+            return store.compose(name, *items)
         return Item(name, *items)
 
     @property
@@ -55,7 +69,7 @@ class Item:
 
     @property
     def price(self):
-        return (sum(item.price for item in self) if self.children else
+        return (_subtotals(self)[self] if self.children else
                 self.__price)
 
     @price.setter
@@ -63,10 +77,244 @@ class Item:
         self.__price = price
 
     def print(self, indent="", file=sys.stdout):
-        print("{}${:.2f} {}".format(indent, self.price, self.name),
-              file=file)
-        for child in self:
-            child.print(indent + "      ")
+        write_tree(self, indent, file)
+
+
+NO_ITEM = -1
+
+
+class ItemStore:
+    """
+    Компактное хранилище дерева: вместо объекта с собственным словарем и
+    списком children на каждый узел приходится по одному элементу в
+    нескольких типизированных массивах. Дочерние узлы связаны через
+    first_child/next_sibling, поэтому у каждого узла не больше одного родителя.
+    Номера узлов хранятся 32-битными числами ("i"), цены - "d".
+
+    Item.create(..., store=store) и Item.compose(..., store=store) возвращают
+    легковесные представления StoredItem, которые ведут себя как Item
+    """
+
+    def __init__(self):
+        self.names = []
+        self.prices = array.array("d")
+        self.parents = array.array("i")
+        self.first_child = array.array("i")
+        self.last_child = array.array("i")
+        self.next_sibling = array.array("i")
+
+    def __len__(self):
+        return len(self.names)
+
+    def create(self, name, price=0.00):
+        self.names.append(name)
+        self.prices.append(price)
+        for offsets in (self.parents, self.first_child, self.last_child,
+                self.next_sibling):
+            offsets.append(NO_ITEM)
+        return StoredItem(self, len(self.names) - 1)
+
+    def compose(self, name, *items):
+        item = self.create(name)
+        if items:
+            item.add(*items)
+        return item
+
+    def link(self, parent, child):
+        if self.parents[child] != NO_ITEM:
+            raise ValueError("{} already belongs to {}".format(
+                    self.names[child], self.names[self.parents[child]]))
+        if child == parent:
+            raise ValueError("cannot add {} to itself".format(
+                    self.names[child]))
+        # Цикл возможен только если у добавляемого узла уже есть дети
+        ancestor = (parent if self.first_child[child] != NO_ITEM else
+                NO_ITEM)
+        while ancestor != NO_ITEM:
+            if ancestor == child:
+                raise ValueError("adding {} to {} would create a cycle".format(
+                        self.names[child], self.names[parent]))
+            ancestor = self.parents[ancestor]
+        self.parents[child] = parent
+        if self.last_child[parent] == NO_ITEM:
+            self.first_child[parent] = child
+        else:
+            self.next_sibling[self.last_child[parent]] = child
+        self.last_child[parent] = child
+
+    def unlink(self, parent, child):
+        if self.parents[child] != parent:
+            raise ValueError("{} is not in {}".format(self.names[child],
+                    self.names[parent]))
+        previous = NO_ITEM
+        index = self.first_child[parent]
+        while index != child:
+            previous, index = index, self.next_sibling[index]
+        following = self.next_sibling[child]
+        if previous == NO_ITEM:
+            self.first_child[parent] = following
+        else:
+            self.next_sibling[previous] = following
+        if self.last_child[parent] == child:
+            self.last_child[parent] = previous
+        self.parents[child] = NO_ITEM
+        self.next_sibling[child] = NO_ITEM
+
+    def children(self, index):
+        index = self.first_child[index]
+        while index != NO_ITEM:
+            yield index
+            index = self.next_sibling[index]
+
+    def totals(self):
+        """
+        Суммы всех поддеревьев за один проход: узлы обходятся в обратном
+        порядке от корней, так что каждый ребенок добавляется к родителю
+        раньше, чем сам родитель к своему. С numpy суммы поднимаются
+        от листьев к корням целыми уровнями
+        """
+        if numpy is not None and len(self):
+            return self._numpy_totals()
+        order = array.array("i", (index for index in range(len(self))
+                if self.parents[index] == NO_ITEM))
+        position = 0
+        while position < len(order):
+            order.extend(self.children(order[position]))
+            position += 1
+        totals = array.array("d", self.prices)
+        for index in order:
+            if self.first_child[index] != NO_ITEM:
+                totals[index] = 0.0
+        for index in reversed(order):
+            parent = self.parents[index]
+            if parent != NO_ITEM:
+                totals[parent] += totals[index]
+        return totals
+
+    def _numpy_totals(self):
+        # Узел готов, когда к нему добавлены суммы всех детей (waiting == 0);
+        # за один шаг к родителям добавляются суммы всех готовых узлов
+        parents = numpy.frombuffer(self.parents, dtype=numpy.intc)
+        leaves = numpy.frombuffer(self.first_child, dtype=numpy.intc) == NO_ITEM
+        totals = numpy.where(leaves, numpy.frombuffer(self.prices,
+                dtype=numpy.float64), 0.0)
+        linked = parents != NO_ITEM
+        waiting = numpy.bincount(parents[linked], minlength=len(self))
+        ready = numpy.flatnonzero(leaves & linked)
+        while ready.size:
+            targets = parents[ready]
+            numpy.add.at(totals, targets, totals[ready])
+            numpy.subtract.at(waiting, targets, 1)
+            targets = numpy.unique(targets)
+            ready = targets[(waiting[targets] == 0) & linked[targets]]
+        return array.array("d", totals.tobytes())
+
+    def subtotal(self, index):
+        if self.first_child[index] == NO_ITEM:
+            return self.prices[index]
+        total = 0.0
+        stack = [index]
+        while stack:
+            index = stack.pop()
+            if self.first_child[index] == NO_ITEM:
+                total += self.prices[index]
+            else:
+                stack.extend(self.children(index))
+        return total
+
+
+class StoredItem:
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __eq__(self, other):
+        if not isinstance(other, StoredItem):
+            return NotImplemented
+        return self.store is other.store and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def name(self):
+        return self.store.names[self.index]
+
+    @name.setter
+    def name(self, name):
+        self.store.names[self.index] = name
+
+    @property
+    def composite(self):
+        return self.store.first_child[self.index] != NO_ITEM
+
+    def add(self, first, *items):
+        for item in itertools.chain((first,), items):
+            self.store.link(self.index, item.index)
+
+    def remove(self, item):
+        self.store.unlink(self.index, item.index)
+
+    def __iter__(self):
+        store = self.store
+        return (StoredItem(store, index) for index in
+                store.children(self.index))
+
+    @property
+    def price(self):
+        return self.store.subtotal(self.index)
+
+    @price.setter
+    def price(self, price):
+        self.store.prices[self.index] = price
+
+    def print(self, indent="", file=sys.stdout):
+        write_tree(self, indent, file)
+
+
+def _subtotals(root):
+    # Суммы считаются обходом в обратном порядке с явным стеком, поэтому
+    # глубокие наборы не упираются в ограничение рекурсии. В path лежат
+    # раскрытые, но еще не посчитанные наборы - предки текущего элемента,
+    # и встретить одного из них среди детей значит найти цикл
+    totals = {}
+    path = set()
+    stack = [(root, False)]
+    while stack:
+        item, expanded = stack.pop()
+        if item in totals:
+            continue
+        if not item.composite:
+            totals[item] = item.price
+        elif expanded:
+            totals[item] = sum(totals[child] for child in item)
+            path.discard(item)
+        else:
+            path.add(item)
+            stack.append((item, True))
+            for child in item:
+                if child in path:
+                    raise ValueError("{} contains itself".format(child.name))
+                if child not in totals:
+                    stack.append((child, False))
+    return totals
+
+
+def walk(item):
+    """
+    treeprint.walk() с суммами из одного прохода _subtotals(): цена набора
+    Item считается обходом его поддерева, и без этого обход глубокого
+    дерева был бы квадратичным
+    """
+    return treeprint.walk(item, _subtotals(item).__getitem__)
+
+
+def write_tree(item, indent="", file=sys.stdout, buffer_size=65536):
+    treeprint.write_tree(item, indent, file, buffer_size,
+                         _subtotals(item).__getitem__)
 
 
 def make_item(name, price):
@@ -77,5 +325,11 @@ def make_composite(name, *items):
     return Item(name, *items)
 
 
+def load_catalog(filenameOrFile, format=None, store=None):
+    return catalog.load(filenameOrFile,
+            lambda name, price: Item.create(name, price, store=store),
+            lambda name: Item.compose(name, store=store), format)
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Печать деревьев составных элементов для stationery и stationery2.
+
+Дерево обходится без рекурсии, а строки выводятся крупными блоками, поэтому
+глубокие и большие наборы печатаются без RecursionError и без тысяч
+мелких вызовов file.write()
+"""
+import sys
+
+INDENT = "      "
+
+
+def walk(item, subtotal=None):
+    """
+    Обходит дерево в прямом порядке без рекурсии и возвращает кортежи
+    (depth, item, subtotal). subtotal(item) возвращает сумму элемента,
+    по умолчанию это item.price
+    """
+    if subtotal is None:
+        subtotal = _price
+    stack = [(0, item)]
+    while stack:
+        depth, item = stack.pop()
+        yield depth, item, subtotal(item)
+        stack.extend((depth + 1, child) for child in reversed(list(item)))
+
+
+def write_tree(item, indent="", file=sys.stdout, buffer_size=65536,
+        subtotal=None):
+    """
+    Строки накапливаются в буфере и выводятся крупными блоками, а строки
+    отступов создаются по одной на каждый уровень вложенности
+    """
+    indents = [indent]
+    lines = []
+    size = 0
+    for depth, item, total in walk(item, subtotal):
+        while len(indents) <= depth:
+            indents.append(indents[-1] + INDENT)
+        line = "{}${:.2f} {}\n".format(indents[depth], total, item.name)
+        lines.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            file.write("".join(lines))
+            lines.clear()
+            size = 0
+    if lines:
+        file.write("".join(lines))
+
+
+def _price(item):
+    return item.price